@@ -1,27 +1,186 @@
-import fitz  # PyMuPDF
 from docx import Document
 from typing import List, Dict, Any, Optional
+from collections import OrderedDict
+import hashlib
 import os
+import re
+import numpy as np
 from sentence_transformers import SentenceTransformer
 import chromadb
 from chromadb.config import Settings
+from pdf_extractor import extract_pdf_pages
+
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+# Larger batches only pay off on accelerators; on CPU they just add padding
+EMBEDDING_BATCH_SIZES = {"cpu": 32, "cuda": 128, "mps": 128}
+EMBEDDING_CACHE_SIZE = 50_000
+# A sentence runs up to terminal punctuation followed by whitespace (so
+# decimals and URLs stay intact) or to the end of the text
+_SENTENCE_RE = re.compile(r'\S.*?(?:[.!?]+(?=\s)|$)', re.DOTALL)
+# HNSW index parameters; Chroma's defaults (M=16, search_ef=10) lose recall
+# on larger stores
+HNSW_M = 24
+HNSW_CONSTRUCTION_EF = 128
+HNSW_SEARCH_EF = 100
 
 class DocumentProcessor:
     def __init__(self):
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        self.chroma_client = chromadb.Client(Settings(
-            persist_directory="vector_store",
-            anonymized_telemetry=False
-        ))
+        self.device = self._detect_device()
+        self.embedding_model = self._load_embedding_model()
+        self.batch_size = EMBEDDING_BATCH_SIZES[self.device]
+        self._embedding_cache: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self.chroma_client = chromadb.PersistentClient(
+            path="vector_store",
+            settings=Settings(anonymized_telemetry=False)
+        )
         self.collection = self.chroma_client.get_or_create_collection(
             name="documents",
-            metadata={"hnsw:space": "cosine"}
+            metadata={
+                # Embeddings are normalized, so ip ranks exactly like cosine
+                # without recomputing norms for every comparison
+                "hnsw:space": "ip",
+                "hnsw:M": HNSW_M,
+                "hnsw:construction_ef": HNSW_CONSTRUCTION_EF,
+                "hnsw:search_ef": HNSW_SEARCH_EF
+            }
         )
 
+    @staticmethod
+    def _detect_device() -> str:
+        """Pick the fastest available device for the embedding model"""
+        try:
+            import torch
+            if torch.cuda.is_available():
+                return "cuda"
+            if torch.backends.mps.is_available():
+                return "mps"
+        except Exception:
+            pass
+        return "cpu"
+
+    @staticmethod
+    def _has_avx512_vnni() -> bool:
+        """Check whether the CPU supports AVX-512 VNNI int8 instructions"""
+        try:
+            with open('/proc/cpuinfo', 'r') as f:
+                return 'avx512_vnni' in f.read()
+        except OSError:
+            return False
+
+    @staticmethod
+    def _has_onnx_cuda() -> bool:
+        """Check whether the installed ONNX Runtime can run on CUDA"""
+        try:
+            import onnxruntime
+            return "CUDAExecutionProvider" in onnxruntime.get_available_providers()
+        except Exception:
+            return False
+
+    def _load_embedding_model(self) -> SentenceTransformer:
+        """Load the embedding model on the best backend for the detected device"""
+        # ONNX Runtime has no MPS execution provider, and the CPU-only
+        # onnxruntime build has no CUDA one, so GPUs fall back to FP16 PyTorch
+        if self.device == "mps" or (self.device == "cuda" and not self._has_onnx_cuda()):
+            return SentenceTransformer(EMBEDDING_MODEL, device=self.device).half()
+
+        if self.device == "cuda":
+            # The O4-optimized export runs in FP16 on the GPU
+            backend = "onnx"
+            model_kwargs = {"file_name": "onnx/model_O4.onnx", "provider": "CUDAExecutionProvider"}
+        # The VNNI-quantized ONNX export only pays off on CPUs with AVX-512 VNNI;
+        # other hosts get the OpenVINO int8 export instead.
+        elif self._has_avx512_vnni():
+            backend = "onnx"
+            model_kwargs = {"file_name": "onnx/model_qint8_avx512_vnni.onnx"}
+        else:
+            backend = "openvino"
+            model_kwargs = {"file_name": "openvino/openvino_model_qint8_quantized.xml"}
+        try:
+            return SentenceTransformer(
+                EMBEDDING_MODEL,
+                device=self.device,
+                backend=backend,
+                model_kwargs=model_kwargs
+            )
+        except Exception as e:
+            print(f"Error loading {backend} embedding model, falling back to PyTorch: {e}")
+            model = SentenceTransformer(EMBEDDING_MODEL, device=self.device)
+            return model.half() if self.device == "cuda" else model
+
+    def _encode_cached(self, texts: List[str]) -> np.ndarray:
+        """Encode texts, reusing embeddings of previously seen texts"""
+        if not texts:
+            return np.empty((0, self.embedding_model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        keys = [hashlib.blake2b(t.encode('utf-8'), digest_size=16).digest() for t in texts]
+        found = {}
+        misses = {}
+        for key, text in zip(keys, texts):
+            if key in found or key in misses:
+                continue
+            if key in self._embedding_cache:
+                self._embedding_cache.move_to_end(key)
+                found[key] = self._embedding_cache[key]
+            else:
+                misses[key] = text
+
+        if misses:
+            # encode() sorts inputs by length before batching, so each batch
+            # is padded only to its own longest chunk
+            # Unit-length embeddings make inner product equal to cosine similarity
+            new_embeddings = self.embedding_model.encode(
+                list(misses.values()), batch_size=self.batch_size, normalize_embeddings=True
+            )
+            # Half-precision models return float16, the vector store expects float32
+            new_embeddings = np.asarray(new_embeddings, dtype=np.float32)
+            for key, embedding in zip(misses, new_embeddings):
+                # Copy each row so a cached entry does not keep the whole batch alive
+                embedding = embedding.copy()
+                found[key] = embedding
+                self._embedding_cache[key] = embedding
+            while len(self._embedding_cache) > EMBEDDING_CACHE_SIZE:
+                self._embedding_cache.popitem(last=False)
+
+        return np.stack([found[key] for key in keys])
+
     def process_document(self, file_path: str) -> List[Dict[str, Any]]:
         """
         Process a document and return chunks with metadata
         """
+        return self.process_documents([file_path])[0]
+
+    def process_documents(self, file_paths: List[str], errors: Optional[Dict[str, str]] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Process several documents with a single embedding pass and return
+        the chunks with metadata for each document. If errors is given, a
+        document that cannot be read is skipped, gets no chunks, and has its
+        error recorded there under its path instead of failing the batch
+        """
+        chunks_per_file = []
+        for path in file_paths:
+            try:
+                chunks_per_file.append(self._chunk_text(self._read_text(path)))
+            except Exception as e:
+                if errors is None:
+                    raise
+                errors[path] = str(e)
+                chunks_per_file.append(None)
+        all_chunks = [chunk for chunks in chunks_per_file if chunks for chunk in chunks]
+        embeddings = self._encode_cached(all_chunks)
+
+        processed = []
+        offset = 0
+        for file_path, chunks in zip(file_paths, chunks_per_file):
+            if chunks is None:
+                processed.append([])
+                continue
+            file_embeddings = embeddings[offset:offset + len(chunks)]
+            offset += len(chunks)
+            processed.append(self._process_chunks(chunks, file_path, file_embeddings))
+        return processed
+
+    def _read_text(self, file_path: str) -> str:
+        """Extract the raw text of a document based on its extension"""
         file_extension = os.path.splitext(file_path)[1].lower()
         text = ""
         
@@ -33,15 +192,14 @@ class DocumentProcessor:
             with open(file_path, 'r', encoding='utf-8') as f:
                 text = f.read()
         
-        chunks = self._chunk_text(text)
-        return self._process_chunks(chunks, file_path)
+        return text
 
     def _read_pdf(self, file_path: str) -> str:
         """Extract text from PDF file with page numbers"""
-        doc = fitz.open(file_path)
+        pages = extract_pdf_pages(file_path)
+
         text_with_pages = []
-        for page_num, page in enumerate(doc, 1):
-            text = page.get_text()
+        for page_num, text in pages:
             if text.strip():
                 text_with_pages.append(f"[Page {page_num}] {text}")
         return "\n".join(text_with_pages)
@@ -57,34 +215,35 @@ class DocumentProcessor:
 
     def _chunk_text(self, text: str, chunk_size: int = 500) -> List[str]:
         """Split text into chunks"""
-        # Simple sentence-based chunking
-        sentences = text.split('.')
+        # Sentence-based chunking, greedily packing sentences up to chunk_size
+        spans = np.array([m.span() for m in _SENTENCE_RE.finditer(text)], dtype=np.int64)
+        if not len(spans):
+            return []
+        starts, ends = spans[:, 0], spans[:, 1]
+
+        # Prefix sums of sentence lengths let each chunk boundary be found
+        # with a binary search instead of a per-sentence Python loop
+        offsets = np.concatenate(([0], np.cumsum(ends - starts)))
+
         chunks = []
-        current_chunk = []
-        current_size = 0
-        
-        for sentence in sentences:
-            sentence = sentence.strip()
-            if not sentence:
-                continue
-                
-            if current_size + len(sentence) > chunk_size and current_chunk:
-                chunks.append('. '.join(current_chunk) + '.')
-                current_chunk = []
-                current_size = 0
-                
-            current_chunk.append(sentence)
-            current_size += len(sentence)
-            
-        if current_chunk:
-            chunks.append('. '.join(current_chunk) + '.')
-            
+        start = 0
+        while start < len(spans):
+            end = int(np.searchsorted(offsets, offsets[start] + chunk_size, side='right')) - 1
+            # A sentence longer than chunk_size still becomes its own chunk
+            end = max(end, start + 1)
+            chunks.append(text[starts[start]:ends[end - 1]])
+            start = end
+
         return chunks
 
-    def _process_chunks(self, chunks: List[str], file_path: str) -> List[Dict[str, Any]]:
-        """Process chunks and store in vector database"""
+    def _process_chunks(self, chunks: List[str], file_path: str, embeddings: np.ndarray) -> List[Dict[str, Any]]:
+        """Store embedded chunks in vector database"""
         file_name = os.path.basename(file_path)
-        embeddings = self.embedding_model.encode(chunks)
+        # The store persists across restarts, so drop chunks from any earlier
+        # upload under this name; add() would skip their ids and keep stale text
+        self.remove_document(file_name)
+        if not chunks:
+            return []
         
         # Extract page numbers from chunks if present
         chunk_metadata = []
@@ -101,7 +260,7 @@ class DocumentProcessor:
         
         # Store in ChromaDB
         self.collection.add(
-            embeddings=embeddings.tolist(),
+            embeddings=np.ascontiguousarray(embeddings, dtype=np.float32),
             documents=chunks,
             metadatas=chunk_metadata,
             ids=[f"{file_name}_{i}" for i in range(len(chunks))]
@@ -116,26 +275,34 @@ class DocumentProcessor:
 
     def search_similar(self, query: str, k: int = 5, document_filter: Optional[str] = None) -> List[Dict[str, Any]]:
         """Search for similar chunks to the query"""
-        query_embedding = self.embedding_model.encode([query])[0]
+        return self.search_similar_batch([query], k=k, document_filter=document_filter)[0]
+
+    def search_similar_batch(self, queries: List[str], k: int = 5, document_filter: Optional[str] = None) -> List[List[Dict[str, Any]]]:
+        """Search for similar chunks to each query with a single encode and query call"""
+        if not queries:
+            return []
+        
+        query_embeddings = np.ascontiguousarray(self._encode_cached(queries), dtype=np.float32)
         
         # Apply document filter if specified
         where = {"source": document_filter} if document_filter else None
         
         results = self.collection.query(
-            query_embeddings=[query_embedding.tolist()],
+            query_embeddings=query_embeddings,
             n_results=k,
             where=where
         )
         
-        return [{
+        return [[{
             "text": doc,
             "source": meta["source"],
             "page": meta.get("page"),
             "score": score
-        } for doc, meta, score in zip(
-            results["documents"][0],
-            results["metadatas"][0],
-            results["distances"][0]
+        } for doc, meta, score in zip(documents, metadatas, distances)]
+        for documents, metadatas, distances in zip(
+            results["documents"],
+            results["metadatas"],
+            results["distances"]
         )]
 
     def get_document_content(self, filename: str) -> str:
@@ -155,16 +322,38 @@ class DocumentProcessor:
         else:
             raise ValueError(f"Unsupported file type: {file_extension}")
 
+    def get_document_chunks(self, filename: str) -> str:
+        """Reassemble a document's text from its chunks in the vector store"""
+        results = self.collection.get(
+            where={"source": filename},
+            include=["documents"]
+        )
+        if not results["ids"]:
+            # Documents uploaded before the store was persistent were never
+            # indexed here, so read them from the uploaded file instead
+            return self.get_document_content(filename)
+        
+        # Chunk ids are f"{filename}_{index}", so the suffix restores document order
+        ordered = sorted(
+            zip(results["ids"], results["documents"]),
+            key=lambda item: int(item[0].rsplit("_", 1)[1])
+        )
+        return "\n\n".join(doc for _, doc in ordered)
+
     def remove_document(self, filename: str):
         """Remove a document's chunks from the vector store"""
         try:
-            # Get all IDs for the document
-            results = self.collection.get(
-                where={"source": filename}
-            )
-            if results["ids"]:
-                self.collection.delete(
-                    ids=results["ids"]
+            try:
+                # Let the store apply the filter instead of round-tripping the ids
+                self.collection.delete(where={"source": filename})
+            except Exception:
+                # Get all IDs for the document
+                results = self.collection.get(
+                    where={"source": filename}
                 )
+                if results["ids"]:
+                    self.collection.delete(
+                        ids=results["ids"]
+                    )
         except Exception as e:
             print(f"Error removing document from vector store: {e}") 
\ No newline at end of file
@@ -1,59 +1,133 @@
-from typing import List, Dict
+from typing import List, Dict, AsyncIterator
+from io import StringIO
+import asyncio
 import os
-from openai import OpenAI
+import httpx
+import tiktoken
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
 
 load_dotenv()
 
-class LLMService:
-    def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.model = "gpt-4"  # Can be changed to other models
+ANSWER_SYSTEM_PROMPT = "You are a helpful AI assistant that answers questions based on provided context."
+SUMMARY_SYSTEM_PROMPT = "You are a helpful AI assistant that creates clear and concise document summaries."
 
-    def generate_answer(self, query: str, context_chunks: List[Dict]) -> str:
-        """
-        Generate an answer based on the query and relevant context chunks
-        """
-        # Prepare context with page numbers
-        context = "\n\n".join([
-            f"Source: {chunk['source']}" + 
-            (f" (Page {chunk['page']})" if 'page' in chunk else "") +
-            f"\nContent: {chunk['text']}"
-            for chunk in context_chunks
-        ])
-
-        # Prepare the prompt
-        prompt = f"""You are a helpful AI assistant. Answer the question based on the following context.
+# Static parts of the question-answering prompt, around the context and question
+ANSWER_PROMPT_HEAD = """You are a helpful AI assistant. Answer the question based on the following context.
         If the answer cannot be found in the context, say "I don't have enough information to answer that question."
         Include specific page numbers or paragraph numbers in your answer when available.
 
         Context:
-        {context}
+        """
+ANSWER_PROMPT_QUESTION = """
 
-        Question: {query}
+        Question: """
+ANSWER_PROMPT_TAIL = """
 
         Answer:"""
 
+# Documents longer than this are summarized in windows first, then combined
+SUMMARY_MAX_INPUT_TOKENS = 6000
+SUMMARY_WINDOW_TOKENS = 4000
+SUMMARY_WINDOW_OVERLAP = 200
+# Upper bound on concurrent window requests, to stay within rate limits
+SUMMARY_CONCURRENCY = 10
+
+class LLMService:
+    def __init__(self):
+        # One pooled keep-alive client shared by all requests, so calls reuse
+        # connections instead of paying a TLS handshake each time
+        self.client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_keepalive_connections=50, max_connections=100)
+            )
+        )
+        self.model = "gpt-4"  # Can be changed to other models
+        self.encoding = tiktoken.encoding_for_model(self.model)
+
+    async def close(self):
+        """Close the pooled HTTP connections"""
+        await self.client.close()
+
+    async def generate_answer(self, query: str, context_chunks: List[Dict]) -> AsyncIterator[str]:
+        """
+        Generate an answer based on the query and relevant context chunks,
+        yielding it piece by piece as the model streams it
+        """
+        # Prepare the prompt, writing the context with page numbers straight
+        # into one buffer instead of building a string per chunk
+        prompt = StringIO()
+        prompt.write(ANSWER_PROMPT_HEAD)
+        for i, chunk in enumerate(context_chunks):
+            if i:
+                prompt.write("\n\n")
+            prompt.write("Source: ")
+            prompt.write(chunk['source'])
+            if 'page' in chunk:
+                prompt.write(f" (Page {chunk['page']})")
+            prompt.write("\nContent: ")
+            prompt.write(chunk['text'])
+        prompt.write(ANSWER_PROMPT_QUESTION)
+        prompt.write(query)
+        prompt.write(ANSWER_PROMPT_TAIL)
+
         try:
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model=self.model,
                 messages=[
-                    {"role": "system", "content": "You are a helpful AI assistant that answers questions based on provided context."},
-                    {"role": "user", "content": prompt}
+                    {"role": "system", "content": ANSWER_SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt.getvalue()}
                 ],
                 temperature=0.7,
-                max_tokens=500
+                max_tokens=500,
+                stream=True
             )
             
-            return response.choices[0].message.content.strip()
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
         except Exception as e:
-            return f"Error generating answer: {str(e)}"
+            yield f"Error generating answer: {str(e)}"
 
-    def generate_summary(self, content: str) -> str:
+    async def generate_summary(self, content: str) -> AsyncIterator[str]:
         """
-        Generate a summary of the document content
+        Generate a summary of the document content, yielding it piece by
+        piece as the model streams it
         """
-        prompt = f"""Please provide a comprehensive summary of the following document.
+        try:
+            # Map-reduce documents that do not fit in one prompt: summarize
+            # overlapping windows in parallel until the result fits
+            tokens = self.encoding.encode(content, disallowed_special=())
+            is_partial = False
+            while len(tokens) > SUMMARY_MAX_INPUT_TOKENS:
+                step = SUMMARY_WINDOW_TOKENS - SUMMARY_WINDOW_OVERLAP
+                windows = [
+                    self.encoding.decode(tokens[i:i + SUMMARY_WINDOW_TOKENS])
+                    # Stop before a last window that would lie wholly inside the
+                    # previous window's overlap
+                    for i in range(0, max(len(tokens) - SUMMARY_WINDOW_OVERLAP, 1), step)
+                ]
+                semaphore = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+                partial_summaries = await asyncio.gather(*[
+                    self._summarize_window(window, semaphore) for window in windows
+                ])
+                content = "\n\n".join(partial_summaries)
+                tokens = self.encoding.encode(content, disallowed_special=())
+                is_partial = True
+
+            if is_partial:
+                prompt = f"""The following are summaries of consecutive sections of one document.
+        Combine them into a comprehensive summary of the whole document.
+        Include key points and main ideas. If the document has sections, summarize each major section.
+        Present the summary in a clear, structured format with bullet points for main ideas.
+
+        Section Summaries:
+        {content}
+
+        Summary:"""
+            else:
+                prompt = f"""Please provide a comprehensive summary of the following document.
         Include key points and main ideas. If the document has sections, summarize each major section.
         Present the summary in a clear, structured format with bullet points for main ideas.
 
@@ -62,25 +136,60 @@ class LLMService:
 
         Summary:"""
 
-        try:
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model=self.model,
                 messages=[
-                    {"role": "system", "content": "You are a helpful AI assistant that creates clear and concise document summaries."},
+                    {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
                     {"role": "user", "content": prompt}
                 ],
                 temperature=0.7,
-                max_tokens=800
+                max_tokens=800,
+                stream=True
             )
             
-            return response.choices[0].message.content.strip()
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
         except Exception as e:
-            return f"Error generating summary: {str(e)}"
+            yield f"Error generating summary: {str(e)}"
+
+    async def _summarize_window(self, window: str, semaphore: asyncio.Semaphore) -> str:
+        """
+        Summarize one section of a document that is too long for a single prompt
+        """
+        prompt = f"""Summarize the following section of a larger document.
+        Keep the key points, main ideas and any page or paragraph numbers.
+
+        Section Content:
+        {window}
+
+        Summary:"""
+
+        async with semaphore:
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.7,
+                max_tokens=500
+            )
+        return response.choices[0].message.content.strip()
 
     def format_answer_with_sources(self, answer: str, context_chunks: List[Dict]) -> Dict:
         """
         Format the answer with source references
         """
+        return {
+            "text": answer,
+            "sources": self.format_sources(context_chunks)
+        }
+
+    def format_sources(self, context_chunks: List[Dict]) -> List[Dict]:
+        """
+        Build the deduplicated source references for the context chunks
+        """
         sources = []
         seen_sources = set()
         
@@ -96,7 +205,4 @@ class LLMService:
                 sources.append(source_info)
                 seen_sources.add(source_key)
         
-        return {
-            "text": answer,
-            "sources": sources
-        } 
\ No newline at end of file
+        return sources 
\ No newline at end of file
@@ -1,21 +1,61 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Body
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 import os
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, AsyncIterator
 from dotenv import load_dotenv
 from document_processor import DocumentProcessor
 from llm_service import LLMService
-import json
+from pdf_extractor import shutdown_executor
+import aiofiles
+import aiosqlite
+import orjson
 from datetime import datetime
+from contextlib import asynccontextmanager
 
 # Load environment variables
 load_dotenv()
 
+METADATA_DB = os.path.join("document_metadata", "documents.db")
+# Metadata from before the SQLite store, imported once on first startup
+LEGACY_METADATA_FILE = os.path.join("document_metadata", "documents.json")
+
+async def init_metadata_db():
+    is_new_db = not os.path.exists(METADATA_DB)
+    async with aiosqlite.connect(METADATA_DB) as db:
+        await db.execute(
+            "CREATE TABLE IF NOT EXISTS docs (name TEXT PRIMARY KEY, uploaded_at TEXT, size INTEGER)"
+        )
+        if is_new_db and os.path.exists(LEGACY_METADATA_FILE):
+            async with aiofiles.open(LEGACY_METADATA_FILE, 'rb') as f:
+                legacy = orjson.loads(await f.read())
+            await db.executemany(
+                "INSERT OR REPLACE INTO docs (name, uploaded_at, size) VALUES (?, ?, ?)",
+                [(doc["name"], doc["uploadedAt"], doc.get("size")) for doc in legacy]
+            )
+        await db.commit()
+
+# Services are created on startup rather than at import time: spawned PDF
+# workers re-run this module when the app is started with `python main.py`,
+# and must not load the embedding model or open the vector store
+document_processor: Optional[DocumentProcessor] = None
+llm_service: Optional[LLMService] = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global document_processor, llm_service
+    document_processor = DocumentProcessor()
+    llm_service = LLMService()
+    await init_metadata_db()
+    yield
+    await llm_service.close()
+    shutdown_executor()
+
 app = FastAPI(
     title="SmartDoc AI",
     description="API for document processing and question answering",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -27,35 +67,36 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+UPLOAD_CHUNK_SIZE = 1 << 20
+
 # Create necessary directories
 os.makedirs("uploads", exist_ok=True)
 os.makedirs("vector_store", exist_ok=True)
 os.makedirs("document_metadata", exist_ok=True)
 
-# Initialize services
-document_processor = DocumentProcessor()
-llm_service = LLMService()
-
-def save_document_metadata(filename: str):
-    metadata_file = os.path.join("document_metadata", "documents.json")
+async def save_document_metadata(filename: str):
     try:
-        if os.path.exists(metadata_file):
-            with open(metadata_file, 'r') as f:
-                metadata = json.load(f)
-        else:
-            metadata = []
-        
-        metadata.append({
-            "name": filename,
-            "uploadedAt": datetime.now().isoformat(),
-            "size": os.path.getsize(os.path.join("uploads", filename))
-        })
-        
-        with open(metadata_file, 'w') as f:
-            json.dump(metadata, f)
+        async with aiosqlite.connect(METADATA_DB) as db:
+            await db.execute(
+                "INSERT OR REPLACE INTO docs (name, uploaded_at, size) VALUES (?, ?, ?)",
+                (filename, datetime.now().isoformat(), os.path.getsize(os.path.join("uploads", filename)))
+            )
+            await db.commit()
     except Exception as e:
         print(f"Error saving metadata: {e}")
 
+def sse_event(data, event: Optional[str] = None) -> str:
+    """Encode a JSON payload as a server-sent event"""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {orjson.dumps(data).decode()}\n\n"
+
+async def stream_with_sources(text_stream: AsyncIterator[str], sources: List[Dict]) -> AsyncIterator[str]:
+    """Stream the sources first, then the generated text as it arrives"""
+    yield sse_event(sources, event="sources")
+    async for text in text_stream:
+        yield sse_event(text)
+    yield sse_event(None, event="done")
+
 @app.get("/")
 async def root():
     return {"message": "SmartDoc AI API is running"}
@@ -66,11 +107,13 @@ async def list_documents():
     List all uploaded documents with their metadata
     """
     try:
-        metadata_file = os.path.join("document_metadata", "documents.json")
-        if os.path.exists(metadata_file):
-            with open(metadata_file, 'r') as f:
-                return JSONResponse(status_code=200, content=json.load(f))
-        return JSONResponse(status_code=200, content=[])
+        async with aiosqlite.connect(METADATA_DB) as db:
+            async with db.execute("SELECT name, uploaded_at, size FROM docs ORDER BY uploaded_at") as cursor:
+                rows = await cursor.fetchall()
+        return JSONResponse(
+            status_code=200,
+            content=[{"name": name, "uploadedAt": uploaded_at, "size": size} for name, uploaded_at, size in rows]
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -80,28 +123,52 @@ async def upload_documents(files: List[UploadFile] = File(...)):
     Upload multiple documents for processing
     """
     try:
-        saved_files = []
+        # Validate every file type before writing anything, so a rejected
+        # upload never leaves unprocessed files behind
         for file in files:
-            # Validate file type
             if not file.filename.endswith(('.pdf', '.docx', '.txt')):
                 raise HTTPException(status_code=400, detail=f"Unsupported file type: {file.filename}")
-            
+        
+        saved_files = []
+        for file in files:
             # Save file
             file_path = os.path.join("uploads", file.filename)
             with open(file_path, "wb") as buffer:
-                content = await file.read()
-                buffer.write(content)
-            
-            # Process document
-            document_processor.process_document(file_path)
+                # Copy in 1 MiB chunks so large uploads never sit fully in memory
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    buffer.write(chunk)
             saved_files.append(file.filename)
-            
-            # Save metadata
-            save_document_metadata(file.filename)
         
+        # Process all documents with a single embedding pass; a file that
+        # cannot be read is reported instead of failing the whole batch
+        file_paths = [os.path.join("uploads", name) for name in saved_files]
+        errors: Dict[str, str] = {}
+        try:
+            document_processor.process_documents(file_paths, errors=errors)
+        except Exception:
+            # Embedding or storage failed for the batch, so don't leave
+            # saved files behind without chunks or metadata
+            for file_path in file_paths:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+            raise
+        
+        failed = {}
+        for file_path, error in errors.items():
+            os.remove(file_path)
+            failed[os.path.basename(file_path)] = error
+        processed_files = [name for name in saved_files if name not in failed]
+        
+        # Save metadata
+        for filename in processed_files:
+            await save_document_metadata(filename)
+        
+        message = "Files uploaded and processed successfully"
+        if failed:
+            message = "Some files could not be processed"
         return JSONResponse(
             status_code=200,
-            content={"message": "Files uploaded and processed successfully", "files": saved_files}
+            content={"message": message, "files": processed_files, "failed": failed}
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -115,15 +182,13 @@ async def ask_question(question: str = Form(...), document: Optional[str] = Form
         # Search for relevant chunks
         context_chunks = document_processor.search_similar(question, document_filter=document)
         
-        # Generate answer
+        # Stream the answer together with its sources
         answer = llm_service.generate_answer(question, context_chunks)
+        sources = llm_service.format_sources(context_chunks)
         
-        # Format response with sources
-        response = llm_service.format_answer_with_sources(answer, context_chunks)
-        
-        return JSONResponse(
-            status_code=200,
-            content=response
+        return StreamingResponse(
+            stream_with_sources(answer, sources),
+            media_type="text/event-stream"
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -138,21 +203,19 @@ async def summarize_document(payload: Dict[str, str] = Body(...)):
         if not document:
             raise HTTPException(status_code=400, detail="Document name is required")
             
-        # Get document content
-        content = document_processor.get_document_content(document)
+        # Get document content from the already indexed chunks
+        content = document_processor.get_document_chunks(document)
         
-        # Generate summary
+        # Stream the summary
         summary = llm_service.generate_summary(content)
+        sources = [{
+            "source": document,
+            "text": "Full document summary"
+        }]
         
-        return JSONResponse(
-            status_code=200,
-            content={
-                "text": summary,
-                "sources": [{
-                    "source": document,
-                    "text": "Full document summary"
-                }]
-            }
+        return StreamingResponse(
+            stream_with_sources(summary, sources),
+            media_type="text/event-stream"
         )
     except FileNotFoundError as e:
         raise HTTPException(status_code=404, detail=str(e))
@@ -171,15 +234,9 @@ async def delete_document(filename: str):
             os.remove(file_path)
         
         # Update metadata
-        metadata_file = os.path.join("document_metadata", "documents.json")
-        if os.path.exists(metadata_file):
-            with open(metadata_file, 'r') as f:
-                metadata = json.load(f)
-            
-            metadata = [doc for doc in metadata if doc["name"] != filename]
-            
-            with open(metadata_file, 'w') as f:
-                json.dump(metadata, f)
+        async with aiosqlite.connect(METADATA_DB) as db:
+            await db.execute("DELETE FROM docs WHERE name = ?", (filename,))
+            await db.commit()
         
         # Remove from vector store
         document_processor.remove_document(filename)
@@ -0,0 +1,57 @@
+import fitz  # PyMuPDF
+from typing import List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import multiprocessing
+import os
+import threading
+
+# Kept free of the embedding and vector store imports, so the worker
+# processes that import this module start quickly
+
+# Below this many pages per worker, the round trip to the pool costs more than it saves
+PARALLEL_PDF_MIN_PAGES = 16
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+def _get_executor() -> ProcessPoolExecutor:
+    """Return the shared worker pool, creating it on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Spawn rather than fork: forking a server that already runs
+            # model and event loop threads can deadlock the child
+            _executor = ProcessPoolExecutor(
+                max_workers=os.cpu_count() or 1,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+def shutdown_executor():
+    """Stop the shared worker pool, if it was started"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+def extract_pages(file_path: str, page_range: range) -> List[Tuple[int, str]]:
+    """Extract (page number, text) pairs for a range of PDF pages"""
+    with fitz.open(file_path) as doc:
+        return [(page_num + 1, doc[page_num].get_text()) for page_num in page_range]
+
+def extract_pdf_pages(file_path: str) -> List[Tuple[int, str]]:
+    """Extract (page number, text) pairs for every page, in parallel for large PDFs"""
+    with fitz.open(file_path) as doc:
+        page_count = doc.page_count
+
+    workers = min(os.cpu_count() or 1, page_count // PARALLEL_PDF_MIN_PAGES)
+    if workers <= 1:
+        return extract_pages(file_path, range(page_count))
+
+    # Give each worker one contiguous slice of pages so it opens the PDF once
+    step = -(-page_count // workers)
+    page_ranges = [range(i, min(i + step, page_count)) for i in range(0, page_count, step)]
+    results = _get_executor().map(partial(extract_pages, file_path), page_ranges)
+    return [page for pages in results for page in pages]
@@ -22,6 +22,40 @@ interface Answer {
   }>;
 }
 
+async function streamAnswer(url: string, init: RequestInit, onUpdate: (answer: Answer) => void) {
+  const response = await fetch(url, init);
+  if (!response.ok || !response.body) {
+    const error = await response.json().catch(() => null);
+    throw new Error(error?.detail || `Request failed with status ${response.status}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  const answer: Answer = { text: '', sources: [] };
+  let buffer = '';
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // Server-sent events are separated by a blank line
+    const events = buffer.split('\n\n');
+    buffer = events.pop() ?? '';
+    for (const event of events) {
+      let name = 'message';
+      let data = '';
+      for (const line of event.split('\n')) {
+        if (line.startsWith('event: ')) name = line.slice(7);
+        else if (line.startsWith('data: ')) data += line.slice(6);
+      }
+      if (name === 'sources') answer.sources = JSON.parse(data);
+      else if (name === 'message') answer.text += JSON.parse(data);
+    }
+    onUpdate({ ...answer });
+  }
+}
+
 export default function Home() {
   const [files, setFiles] = useState<File[]>([]);
   const [documents, setDocuments] = useState<Document[]>([]);
@@ -59,10 +93,17 @@ export default function Home() {
           'Content-Type': 'multipart/form-data',
         },
       });
-      toast.success('Files uploaded successfully');
-      // Add uploaded documents to the list
-      const newDocs = files.map(file => ({
-        name: file.name,
+      const processed: string[] = response.data.files;
+      const failed: Record<string, string> = response.data.failed || {};
+      Object.entries(failed).forEach(([name, error]) => {
+        toast.error(`Could not process ${name}: ${error}`);
+      });
+      if (processed.length > 0) {
+        toast.success('Files uploaded successfully');
+      }
+      // Add the documents that were processed to the list
+      const newDocs = processed.map(name => ({
+        name,
         uploadedAt: new Date().toLocaleString()
       }));
       setDocuments([...documents, ...newDocs]);
@@ -89,8 +130,7 @@ export default function Home() {
         formData.append('document', selectedDocument);
       }
 
-      const response = await axios.post('http://localhost:8000/ask', formData);
-      setAnswer(response.data);
+      await streamAnswer('http://localhost:8000/ask', { method: 'POST', body: formData }, setAnswer);
     } catch (error) {
       toast.error('Error getting answer');
       console.error(error);
@@ -102,18 +142,17 @@ export default function Home() {
   const handleSummarize = async (docName: string) => {
     setIsLoading(true);
     try {
-      const response = await axios.post('http://localhost:8000/summarize', {
-        document: docName
-      }, {
+      await streamAnswer('http://localhost:8000/summarize', {
+        method: 'POST',
         headers: {
           'Content-Type': 'application/json'
-        }
-      });
-      setAnswer(response.data);
+        },
+        body: JSON.stringify({ document: docName })
+      }, setAnswer);
       toast.success('Summary generated successfully');
     } catch (error: any) {
       console.error('Summarization error:', error);
-      toast.error(error.response?.data?.detail || 'Error generating summary');
+      toast.error(error.message || 'Error generating summary');
     } finally {
       setIsLoading(false);
     }